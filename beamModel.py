@@ -294,7 +294,7 @@ def rvm(alpha, beta, prof):
        -----
        alpha   : inclination angle (degrees)
        beta    : impact parameter (degrees) 
-       prof    : one dimentional profile
+       prof    : rotational phases of the profile (degrees)
 
        Return:
        -------
@@ -302,27 +302,18 @@ def rvm(alpha, beta, prof):
 
     """
  #  predict the position angle (psi) swing through the observer's sight line:
-    zeta = alpha + beta
-    points = range(len(prof))
-
-    pa = []
+    alpha = np.deg2rad(alpha)
+    zeta = alpha + np.deg2rad(beta)
     phi0 = 0.
-    for point in points:
-        phi = np.deg2rad(prof[point])
-        numer = np.sin(np.deg2rad(alpha)) * np.sin(np.deg2rad(phi - phi0))
-        denom = np.sin(np.deg2rad(zeta)) * np.cos(np.deg2rad(alpha)) - np.cos(np.rad2deg(zeta)) * np.sin(np.rad2deg(alpha)) * np.cos(np.deg2rad(phi - phi0))
-
-        psi = np.arctan(numer/denom)
+    phi = np.deg2rad(prof)
+    numer = np.sin(alpha) * np.sin(phi - phi0)
+    denom = np.sin(zeta) * np.cos(alpha) - np.cos(zeta) * np.sin(alpha) * np.cos(phi - phi0)
 
-        # restrict psi between [-pi/2, pi/2]
-        if psi < -np.pi/2.:
-            psi = psi + np.pi
+    # restrict psi between [-pi/2, pi/2]
+    psi = (np.arctan2(numer, denom) + np.pi/2.) % np.pi - np.pi/2.
 
-        if psi > np.pi/2.:
-              psi = psi - np.pi
-
-        # Convert psi back to degrees
-        pa.append(np.rad2deg(psi))
+    # Convert psi back to degrees
+    pa = np.rad2deg(psi)
 
     return pa
 
@@ -423,7 +414,7 @@ def extractpulse(sc_train, pulsesfromend, binsperpulse):
         #rectangle = np.min(train[start:inte(end)])*binsperpulse
         #flux = np.sum(train[start:int(end)]) - rectangle
 
-    pulse = sc_train[int(start):int(end)]
+    pulse = sc_train[..., int(start):int(end)]
 
     return pulse
 
@@ -446,6 +437,8 @@ def broadening(tau, P, res):
 
 def scatter(train, bf):
     """Function to scatter a pulse profile / a train of pulse profiles. Returns a convolution of the profile with the scattering function.
+       Works along the last axis, so a 2D stack of trains (one per channel) and
+       of broadening functions is scattered in one batch of FFTs.
 
        Args:
        -----
@@ -456,12 +449,14 @@ def scatter(train, bf):
        -------
        conv    : scattered profile 
     """
-    conv = np.convolve(train, bf)
+    ntrain = np.shape(train)[-1]
+    nconv = ntrain + np.shape(bf)[-1] - 1 # length of the full (linear) convolution
+    conv = np.fft.irfft(np.fft.rfft(train, n=nconv) * np.fft.rfft(bf, n=nconv), n=nconv)
     # normalise the profile:
-    profint = np.sum(train) # integral / area of the profile 
-    convint = np.sum(conv) # integral / area of the scattered profile
-    sc_prof = conv * (profint / float(convint))
-    out = sc_prof[0 : len(train) + 1]
+    profint = np.sum(train, axis=-1, keepdims=True) # integral / area of the profile 
+    convint = np.sum(conv, axis=-1, keepdims=True) # integral / area of the scattered profile
+    sc_prof = conv * (profint / convint)
+    out = sc_prof[..., 0 : ntrain + 1]
 
     return out
 
@@ -689,7 +684,7 @@ def delay(freq_ref, freq , delta_dm, t_res):
        -----
        freq_ref : reference frequecy (in GHz)
        freq     : frequency to shift (in GHz)
-       delta_dm : dispersion measures to try
+       delta_dm : dispersion measures to try (scalar or array; broadcasts with freq)
        t_res    : time per bin (Period/resolution in seconds)
 
        Return:
@@ -702,12 +697,9 @@ def delay(freq_ref, freq , delta_dm, t_res):
     """
     D = 4.148808 * 1e3 # +/- 3e-6 MHz^2 pc^-1 cm^3 s
     delta_t = D * ((freq_ref * 1e3)**(-2) - (freq * 1e3)**(-2)) * delta_dm # in seconds; eqn. 5.2 (handbook)
-    if np.isnan(delta_t):
-        delta_t = np.nan_to_num(delta_t)
-    else:
-        delta_t = delta_t
+    delta_t = np.nan_to_num(delta_t)
 
-    bin_shift = np.int(delta_t * (1/t_res))    # phase shift in bins  
+    bin_shift = np.trunc(delta_t * (1/t_res)).astype(int)    # phase shift in bins  
 
     #print 'bin_shift', bin_shift 
     return bin_shift
@@ -721,6 +713,31 @@ def avg_prof(prof):
 
     return averageP
 
+
+def avg_shifted_prof(prof, bin_shifts):
+    """Function to average profiles after circularly shifting each of them.
+       Same as avg_prof([np.roll(p, s) for p, s in zip(prof, bin_shifts)]),
+       but adds the shifted slices in place instead of building rolled copies.
+
+       Args:
+       -----
+       prof       : profiles (2D array, one profile per channel)
+       bin_shifts : shift of each profile (in bins)
+
+       Return:
+       -------
+       averageP   : average of the shifted profiles
+    """
+    nbins = np.shape(prof)[1]
+    averageP = np.zeros(nbins)
+    for p, shift in zip(prof, bin_shifts):
+        shift = int(shift) % nbins
+        averageP[shift:] += p[:nbins - shift]
+        averageP[:shift] += p[nbins - shift:]
+    averageP /= len(prof)
+
+    return averageP
+
 # ===========================================================================================================================================
 #                                           TEMPLATE  MATCHING  METHOD 
 # ===========================================================================================================================================
@@ -14,7 +14,7 @@ import matplotlib.pyplot as plt
 # ==============================================================================================================================================
 #                                          IMPORTANT FUNCTION:
 # ==============================================================================================================================================
-def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBeam=None, hollowCone=None):
+def generateBeam(P, alpha, beta, xlos, ylos, freq, heights, npatch, snr, do_ab, iseed, fanBeam=None, hollowCone=None):
     """Function to plot the patches for a given rotation period.
     
        A rgs:
@@ -22,6 +22,7 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
        P          : rotational period (seconds)
        alpha      : inclination angle (degrees)
        beta       : impact parameter (degrees)
+       xlos, ylos : line of sight coordinates (degrees), as returned by bm.los
        heights    : emission heights (in km)
        snr        : signal to noise ratio       
        iseed      : seed for the random number generator
@@ -45,11 +46,11 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
     ymax = 180.
     dx = (xmax - xmin)/res
     dy = (ymax - ymin)/res
-    x = np.linspace(xmin, xmax, num=res, endpoint=True)
-    y = np.linspace(ymin, ymax, num=res, endpoint=True)
-    X,Y = np.meshgrid(x,y)
+#   single precision is plenty for the beam grid and halves the memory traffic:
+    x = np.linspace(xmin, xmax, num=res, endpoint=True, dtype=np.float32)
+    y = np.linspace(ymin, ymax, num=res, endpoint=True, dtype=np.float32)
     gauss = np.zeros(len(x))
-    Z = np.zeros_like(X)
+    Z = np.zeros((len(y), len(x)), dtype=np.float32)
     prof_los = np.zeros_like(gauss)
 
 #   find the width of the patches:
@@ -63,64 +64,90 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
     W = 4. * np.rad2deg(np.arcsin(np.sqrt(abs(sin2W4))))
 #   An arbitrary peak of the profile:
     peakAmp = 1.
-#   Get the line of sight:
-    xlos, ylos, thetalos = bm.los(alpha, beta, res)
 #   Get the centre of the emission patches on the xy-plane
     centerx, centery = bm.patch_center(P, heights, npatch, iseed, fanBeam, hollowCone)
 #   Get the ofset due to abberation:
     ab_xofset, ab_yofset = bm.aberration(heights, P, alpha)
-#   Find the 1D and 2D profile:
-    for cid, comp in enumerate(heights):
-#       widths for circular patches:        
-        sigmax = patchwidths[cid]
-        sigmay = patchwidths[cid]
+#   Collect the patches of all components into flat arrays (one entry per patch):
+    npatches = [len(cx) for cx in centerx]
+    patchCenterX = np.concatenate(centerx)
+    patchCenterY = np.concatenate(centery)
+#   widths for circular patches, with the gaussian normalizer and 3-width cutoff of each:
+    sigmas = np.repeat(patchwidths, npatches)
+    inv2sigma2 = 1.0 / (2 * sigmas**2)
+    cutoff2 = 9.0 * sigmas**2
+#   ofset of each gaussian from its patch center (none without aberration):
+    if do_ab:
+        patch_xofset = np.repeat(ab_xofset, npatches)
+        patch_yofset = np.repeat(ab_yofset, npatches)
+    else:
+        patch_xofset = np.zeros(len(sigmas))
+        patch_yofset = np.zeros(len(sigmas))
 
-#       center of the patch:
-        patchCenterX = centerx[cid]
-        patchCenterY = centery[cid]
+#   scratch buffers, reused by every patch instead of allocating grid-sized temporaries:
+    gx = np.empty(len(x), dtype=np.float32)
+    gy = np.empty(len(y), dtype=np.float32)
+    tmp = np.empty_like(Z)
+    inside = np.empty(Z.shape, dtype=bool)
 
-#       2D patch (including aberation):
-        for pc in zip(patchCenterX, patchCenterY):
-            # if distance of current box from the patch center is
-            # larger than 3 times the patchwidth, I do not want any
-            # power contributed
-            # first compute a grid of distance from the center of the patch, in units of the width
-            distance = (np.sqrt((X - pc[0])**2 + (Y - pc[1])**2))/sigmax
-            distance[np.where(distance > 3.0)] = 0.0
-            distance[np.where(distance != 0.0)] = peakAmp
-            if not do_ab:
-                Z += distance * np.exp(-((X - pc[0])**2 / (2 * sigmax**2) + (Y - pc[1])**2 / (2 * sigmay**2)))
-            else:
-                Z += distance * np.exp(-((X - pc[0] - ab_xofset[cid])**2 / (2 * sigmax**2) + (Y - pc[1] - ab_yofset[cid])**2 / (2 * sigmay**2)))
+#   2D patch (including aberation):
+    for pid in range(len(patchCenterX)):
+        # float32 scalars, so the patch arithmetic stays in single precision
+        pc = (np.float32(patchCenterX[pid]), np.float32(patchCenterY[pid]))
+        sigmax = np.float32(sigmas[pid])
+        sigmay = np.float32(sigmas[pid])
+        inv2s = np.float32(inv2sigma2[pid])
+        abx = np.float32(patch_xofset[pid])
+        aby = np.float32(patch_yofset[pid])
+        # if distance of current box from the patch center is
+        # larger than 3 times the patchwidth, I do not want any
+        # power contributed, so only the box within 3 widths of the center is evaluated
+        ix0 = np.searchsorted(x, pc[0] - 3.0 * sigmax)
+        ix1 = np.searchsorted(x, pc[0] + 3.0 * sigmax, side='right')
+        iy0 = np.searchsorted(y, pc[1] - 3.0 * sigmay)
+        iy1 = np.searchsorted(y, pc[1] + 3.0 * sigmay, side='right')
+        if ix0 >= ix1 or iy0 >= iy1:
+            continue # patch falls outside of the grid
+        xb = x[ix0:ix1]
+        yb = y[iy0:iy1]
+        gxb = gx[:ix1 - ix0]
+        gyb = gy[:iy1 - iy0]
+        tmpb = tmp[:iy1 - iy0, :ix1 - ix0]
+        insideb = inside[:iy1 - iy0, :ix1 - ix0]
+        # first compute a grid of squared distance from the center of the patch, and
+        # keep only the points within 3 widths of it (compared squared, so no sqrt)
+        np.add.outer((yb - pc[1])**2, (xb - pc[0])**2, out=tmpb)
+        np.less_equal(tmpb, np.float32(cutoff2[pid]), out=insideb)
+        # the circular gaussian is separable: an outer product of two 1D gaussians
+        np.subtract(xb, pc[0] + abx, out=gxb)
+        np.square(gxb, out=gxb)
+        gxb *= -inv2s
+        np.exp(gxb, out=gxb)
+        np.subtract(yb, pc[1] + aby, out=gyb)
+        np.square(gyb, out=gyb)
+        gyb *= -inv2s
+        np.exp(gyb, out=gyb)
+        gyb *= peakAmp
+        np.multiply.outer(gyb, gxb, out=tmpb)
+        tmpb *= insideb
+        Z[iy0:iy1, ix0:ix1] += tmpb
 #   1D profile from 2D patch, closest to the line of sight (select nearest neighbors):
 #    ZxIdx = np.array((xlos-xmin)/dx, dtype=int) # x index
 #    ZyIdx = np.array((ylos-ymin)/dy, dtype=int) # y index
 #    prof = Z[ZxIdx, ZyIdx]
-    prof = np.zeros(int(res))
+    prof = np.zeros(res)
 # Find the appropriate range to fill the profile
 # First converst our expected width W into bins
     halfbinsW = int(W/360. * res/2.)
-    profilerange = range(int(res/2)-halfbinsW, int(res/2)+halfbinsW, 1)
-    for i in profilerange:
-        for cid, comp in enumerate(heights):
-            #       widths for circular patches:        
-            sigmax = patchwidths[cid]
-            sigmay = patchwidths[cid]
+    profilerange = np.arange(res//2 - halfbinsW, res//2 + halfbinsW)
+#   line of sight points as rows, patches as columns:
+    xl = xlos[profilerange][:, None]
+    yl = ylos[profilerange][:, None]
+    r2 = (xl - patchCenterX)**2 + (yl - patchCenterY)**2
+    mask = np.where(r2 > cutoff2, 0.0, peakAmp)
+    patchGauss = np.exp(-((xl - patchCenterX - patch_xofset)**2 + (yl - patchCenterY - patch_yofset)**2) * inv2sigma2)
+    prof[profilerange] = np.sum(mask * patchGauss, axis=1)
 
-#       center of the patch:
-            patchCenterX = centerx[cid]
-            patchCenterY = centery[cid]
-            for pc in zip(patchCenterX, patchCenterY):
-                distance = (np.sqrt((xlos[i] - pc[0])**2 + (ylos[i] - pc[1])**2))/sigmax
-                if distance > 3.0:
-                    distance  = 0.0
-                else:
-                    distance = peakAmp
-                    if not do_ab:
-                        prof[i] += distance * np.exp(-((xlos[i] - pc[0])**2 / (2 * sigmax**2) + (ylos[i] - pc[1])**2 / (2 * sigmay**2)))
-                    else:
-                        prof[i] += distance * np.exp(-((xlos[i] - pc[0] - ab_xofset[cid])**2 / (2 * sigmax**2) + (ylos[i] - pc[1] - ab_yofset[cid])**2 / (2 * sigmay**2)))
-    
     return prof, Z, W
 
 # ===============================================================================================================================================
@@ -187,13 +214,13 @@ else:
 # =====================
 # initialize params:
 # =====================
-beam = []
-prof = []
-res = 1e3 # resolution
+res = 1000 # resolution (number of bins)
 t_res = P/res # time-reso;ution
 phase = np.linspace(-180, 180, num=res) # rotation phase in degrees
 max_freq = (nch - 1) * chbw + min_freq # maximum frequency
 freq = np.linspace(min_freq, max_freq, nch) # channel frequencies in GHz!!!
+prof = np.empty((nch, res))                      # 1D profile at each frequency
+beam = np.empty((nch, res, res), dtype=np.float32) # 2D beam at each frequency
 
 #=======================================
 #     1. Find the emission height:
@@ -222,11 +249,13 @@ else:
     alpha = args.alpha
 
 # -------- Get the beam & profile --------
+# The line of sight is the same at every frequency:
+xlos, ylos, thetalos = bm.los(alpha, beta, res)
 for i in range(nch):
-    pr, Z, W = generateBeam(P, alpha, beta, freq[i], emission_heights[i], npatch, snr, do_ab, iseed, fanBeam, hollowCone)
+    pr, Z, W = generateBeam(P, alpha, beta, xlos, ylos, freq[i], emission_heights[i], npatch, snr, do_ab, iseed, fanBeam, hollowCone)
 #    w10.append(bm.find_width(pr)) # Width at 10% of the peak 
-    prof.append(pr)               # Profile for that frequency
-    beam.append(Z)                # 2D beam 
+    prof[i] = pr                  # Profile for that frequency
+    beam[i] = Z                   # 2D beam 
 
 #==========================================
 #     3. Scatter the line of sight profile: 
@@ -238,26 +267,22 @@ if not scr:
 
     rand_dm = 0.0   # random Dm for scattering (time_scale : No scattering)
 else:
-    sc_prof = []
     if not args.dm:
         rand_dm = bm.getadm(args.dmFile, iseed, nbins=1000, n=1) # random dm value from a dist. of known psr dm
     else:
         rand_dm = args.dm
     #rand_dm = bm.getadm(args.dmFile, iseed, nbins=500, n=1) # random dm value from a dist. of known psr dm
-    # Follow the scattering routine:
-    for pid in np.arange(len(prof)):
-        # Compute a train of pulses
-        train.append(bm.pulsetrain(3, res, prof[pid]))
-
-    for fid in np.arange(len(freq)):
-        #Find the scattering timescale for the random dm
-        tau = bm.sc_time(freq[fid], rand_dm, iseed)
-        #Determine a broadening function
-        bf = bm.broadening(tau, P, res)
-        #scatter the train of pulses with this function
-        sc_train = bm.scatter(train[fid], bf)
-        #Extract a pulse profile
-        sc_prof.append(bm.extractpulse(sc_train, 2, res))
+    # Follow the scattering routine, for all the channels at once:
+    # Compute a train of pulses
+    train = np.stack([bm.pulsetrain(3, res, pr) for pr in prof])
+    #Find the scattering timescale for the random dm, at every frequency
+    tau = bm.sc_time(freq, rand_dm, iseed)
+    #Determine a broadening function
+    bf = np.stack([bm.broadening(t, P, res) for t in tau])
+    #scatter the trains of pulses with these functions
+    sc_train = bm.scatter(train, bf)
+    #Extract a pulse profile
+    sc_prof = bm.extractpulse(sc_train, 2, res)
 
 #==========================================
 #    Disperse the signal
@@ -316,9 +341,9 @@ if args.writeprofile:
 # Increase the resolution
 if not args.template_matching:
     highres_phase = np.linspace(-180,180,1000*res)
-    resampled = np.zeros((int(nch),int(1000*res)))
+    resampled = np.zeros((nch, 1000*res))
     for nfr in range(len(freq)):
-        resampled[nfr] = resample(profile[nfr], int(1000*res))
+        resampled[nfr] = resample(profile[nfr], 1000*res)
 
     # delta dm search only for profiles with snr above threshold
     #----------------- FIRST ITERATION --------------------------------
@@ -336,7 +361,7 @@ if not args.template_matching:
     #   If scattering included = The range of DM to tries shift by tau from DM used for scatteering
         if args.scatter:
             # Get the delay caused by scattering:
-            delta_tau = bm.sc_time(freq[0], rand_dm, iseed)
+            delta_tau = tau[0]
             # Total time delay:
             delta_t = delta_t + delta_tau
             # Relate to dispersion measure:
@@ -347,8 +372,9 @@ if not args.template_matching:
             D = 4.148808 * 1e3 # +/- 3e-6 MHz^2 pc^-1 cm^3 s
             dm_unscatter = delta_t / (D * ((freq[-1]*1e3)**(-2) - (freq[0]*1e3)**(-2))) 
             dm_range = np.linspace(-0.5*dm_unscatter, dm_unscatter*0.5 , num=20)
+        # Shift (in bins) of every channel for every dm trial; res increased by 1000 more bins
+        bin_shifts = bm.delay(freq[nch - 1], freq, dm_range[:, None], t_res/1000.)
         for dm_id in range(len(dm_range)):
-            shifted_profiles = []
             if args.diagnostic:
                 fig = plt.figure(figsize=(10,5))
                 plt.title('DM trial, delta DM = %.5f' %dm_range[dm_id], fontsize=18)
@@ -359,15 +385,12 @@ if not args.template_matching:
                 plt.xticks(fontsize = 10)
                 plt.yticks(fontsize = 10)
                 plt.grid()
-
-            for freq_id in range(nch):
-                bin_shift = bm.delay(freq[nch - 1], freq[freq_id], dm_range[dm_id], t_res/1000.) # Res increased by 1000 more bins
-                shifted_profiles.append(np.roll(resampled[freq_id], bin_shift))
-                #plt.subplot(1,2,1)
-                plt.plot(highres_phase, shifted_profiles[freq_id] + 2*freq_id, color='grey')
+                for freq_id in range(nch):
+                    #plt.subplot(1,2,1)
+                    plt.plot(highres_phase, np.roll(resampled[freq_id], bin_shifts[dm_id, freq_id]) + 2*freq_id, color='grey')
             #average_profile.append(bm.avg_prof(shifted_profiles))
             #peaks_of_average.append(bm.find_peak(average_profile[dm_id]))
-            average = bm.avg_prof(shifted_profiles)
+            average = bm.avg_shifted_prof(resampled, bin_shifts[dm_id])
             peaks_of_average.append(bm.find_peak(average))
 #            plt.subplot(1,2,2)
 #            plt.plot(highres_phase, average_profile[dm_id])
@@ -425,18 +448,13 @@ if not args.template_matching:
 #----------------- SECOND ITERATION ----------------------------
 #       Search for a best dm
         peaks_of_average = []
+        bin_shifts = bm.delay(freq[nch - 1], freq, dm_range_2[:, None], t_res/1000.) # Res increased by 1000 more bins
         for dm_id in range(len(dm_range_2)):
-            shifted_profiles = []
-            for freq_id in range(nch):
-                bin_shift = bm.delay(freq[nch - 1], freq[freq_id], dm_range_2[dm_id], t_res/1000.) # Res increased by 1000 more bins
-                shifted_profiles.append(np.roll(resampled[freq_id], bin_shift))
-            average = bm.avg_prof(shifted_profiles)
+            average = bm.avg_shifted_prof(resampled, bin_shifts[dm_id])
             peaks_of_average.append(bm.find_peak(average))
         
 #       Find the best dm (dm that maximises SNR)
-        for i in range(len(peaks_of_average)):
-            if peaks_of_average[i] == np.max(peaks_of_average):
-                best_dm = dm_range_2[i]
+        best_dm = dm_range_2[int(np.argmax(peaks_of_average))]
         if args.getPlot:
 #       Create a snr vs dm plot for visualization
             snrfig2 = plt.figure()
@@ -467,8 +485,8 @@ if not args.template_matching:
                 model = 'Patchy_beam'
             pulsarParams = np.asarray([model, min_freq, chbw, nch, P, alpha, beta, \
                                       iseed, int(rand_dm), best_dm])
-            f = open('dm_dat.txt', 'a')
-            f.write(' '.join([str(item) for item in pulsarParams]) + ' \n')
+            with open('dm_dat.txt', 'a') as f:
+                f.write(' '.join([str(item) for item in pulsarParams]) + ' \n')
 else:
     template = sc_prof[-1]
     lag_time = bm.cross_correlate(profile, template, period=P)
@@ -502,8 +520,8 @@ else:
             model = 'Patchy_beam'
         pulsarParams = np.asarray([model, min_freq, chbw, nch, P, alpha, beta, \
         iseed, int(rand_dm), popt[0]])
-        f = open('dm_dat_template_matching.txt', 'a')
-        f.write(' '.join([str(item) for item in pulsarParams]) + ' \n')
+        with open('dm_dat_template_matching.txt', 'a') as f:
+            f.write(' '.join([str(item) for item in pulsarParams]) + ' \n')
 #===========================================================================================================================
 #                     PRODUCE PLOTS:
 #===========================================================================================================================
@@ -531,21 +549,20 @@ if args.getPlot:
         #============================================
         #    2D emission region:
         #============================================
-        xlos, ylos, thetalos = bm.los(alpha, beta, res)
         fig3 = plt.figure(figsize=(14,6))
         ax31 = fig3.add_subplot(1,2,1)
         plt.plot(xlos, ylos, '-', lw=2)
-        plt.imshow(beam[k].T, extent=[-180, 180, 180, -180], cmap='gist_heat')
+        plt.imshow(beam[k], extent=[-180, 180, 180, -180], cmap='gist_heat')
         plt.xlabel('X (degrees)', fontsize=18)
         #plt.title('Beam', fontsize=18)
         plt.ylabel('Y (degrees)', fontsize=18)
         plt.tick_params(axis='both', which='major', labelsize=18)
         # find zoomed extent fior plot
-        nonZero = np.where(beam[0]!= 0.0)    # Set the maximum zoom to beam at lowest frequency
-        nzx_min = np.min(np.amin(nonZero,0))
-        nzy_min = np.min(np.amin(nonZero,1))
-        nzx_max = np.max(np.amax(nonZero,0))
-        nzy_max = np.max(np.amax(nonZero,1))
+        nonZero = beam[0] != 0.0    # Set the maximum zoom to beam at lowest frequency
+        rows = np.flatnonzero(nonZero.any(axis=1)) # rows are y
+        cols = np.flatnonzero(nonZero.any(axis=0)) # columns are x
+        nzy_min, nzy_max = rows[0], rows[-1]
+        nzx_min, nzx_max = cols[0], cols[-1]
         x1 = phase[nzx_min]
         x2 = phase[nzx_max]
         y1 = phase[nzy_min]
@@ -594,13 +611,12 @@ if args.getPlot:
         fig4 = plt.figure(figsize=(10,5))
         ax41 = fig4.add_subplot(1,2,1)
         for bid in range(nch):
-            xlos, ylos, thetalos = bm.los(alpha, beta, res)
             fig4 = plt.figure(figsize=(10,5))
             ax41 = fig4.add_subplot(1,2,1)
             plt.tight_layout()
             plt.tick_params(axis='both', which='major', labelsize=18)
             plt.plot(xlos, ylos, '+r')
-            plt.imshow(beam[bid].T, extent=[-180, 180, 180, -180])
+            plt.imshow(beam[bid], extent=[-180, 180, 180, -180])
             plt.xlabel('X (degrees)', fontsize=18)
             plt.title('Radio pulsar beam', fontsize=18)
             plt.ylabel('Y (degrees)', fontsize=18)
@@ -608,11 +624,11 @@ if args.getPlot:
             #plt.yticks(fontsize=18)
             #plt.tick_params(axis='y', which='both', left='off', top='off', labelleft='off')
             # find zoomed extent for plot
-            nonZero = np.where(beam[0]!= 0.0)     # set the maximum zoom to beam at lowest frequency
-            nzx_min = np.min(np.amin(nonZero,0))
-            nzy_min = np.min(np.amin(nonZero,1))
-            nzx_max = np.max(np.amax(nonZero,0))
-            nzy_max = np.max(np.amax(nonZero,1))
+            nonZero = beam[0] != 0.0     # set the maximum zoom to beam at lowest frequency
+            rows = np.flatnonzero(nonZero.any(axis=1)) # rows are y
+            cols = np.flatnonzero(nonZero.any(axis=0)) # columns are x
+            nzy_min, nzy_max = rows[0], rows[-1]
+            nzx_min, nzx_max = cols[0], cols[-1]
             x1 = phase[nzx_min]
             x2 = phase[nzx_max]
             y1 = phase[nzy_min]
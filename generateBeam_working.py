@@ -16,7 +16,7 @@ from matplotlib.ticker import MultipleLocator
 #==============================================================================================================================================
 #                                          IMPORTANT FUNCTION:
 #==============================================================================================================================================
-def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBeam):
+def generateBeam(P, alpha, beta, ZxIdx, ZyIdx, freq, heights, npatch, snr, do_ab, iseed, fanBeam):
     """Function to plot the patches for a given rotation period.
     
        A rgs:
@@ -24,6 +24,8 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
        P       : rotational period (seconds)
        alpha   : inclination angle (degrees)
        beta    : impact parameter (degrees)
+       ZxIdx   : x indices of the beam pixels along the line of sight
+       ZyIdx   : y indices of the beam pixels along the line of sight
        heights : emission heights (in km)
        centerx : the patch center projection on the x-axis 
        centery : the patch center projection on the y-axis
@@ -45,8 +47,6 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
 #    res = 1e4 #resolution
     ymin = -180.
     ymax = 180.
-    dx = (xmax - xmin)/res
-    dy = (ymax - ymin)/res
     x = np.linspace(xmin, xmax, num=res, endpoint=True)
     y = np.linspace(ymin, ymax, num=res, endpoint=True)
     X,Y = np.meshgrid(x,y)
@@ -58,8 +58,6 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
     patchwidths = bm.patch_width(P, heights)
 #   An arbitrary peak of the profile:
     peakAmp = 1.
-#   Get the line of sight:
-    xlos, ylos, thetalos = bm.los(alpha, beta, res)
 #   Get the centre of the emission patches on the xy-plane
     centerx, centery = bm.patch_center(P, heights, npatch, iseed, fanBeam)
 #   Get the ofset due to abberation:
@@ -89,9 +87,7 @@ def generateBeam(P, alpha, beta, freq, heights, npatch, snr, do_ab, iseed, fanBe
             else:
                 Z += distance * np.exp(-((X - pc[0] - ab_xofset[cid])**2 / (2 * sigmax**2) + (Y - pc[1] - ab_yofset[cid])**2 / (2 * sigmay**2)))
 #   1D profile from 2D patch, closest to the line of sight (select nearest neighbors):
-    ZxIdx = np.array((xlos-xmin)/dx, dtype=int) # x index
-    ZyIdx = np.array((ylos-ymin)/dy, dtype=int) # y index
-    prof = Z[ZxIdx, ZyIdx]
+    prof = Z[ZyIdx, ZxIdx] # rows of Z are y, columns are x
     
     return prof, Z
 
@@ -147,12 +143,16 @@ fileName = args.outfile
 beam = []
 prof = []
 w10 = []
-res = 1e3
+res = 1000
 t_res = P/res
 phase = np.linspace(-180, 180, num=res)
 max_freq = (nch - 1) * chbw + min_freq
 freq = np.linspace(min_freq, max_freq, nch) #channel frequency in GHz!!!
-
+# The line of sight, and the beam pixels nearest to it, are the same at every frequency:
+xlos, ylos, thetalos = bm.los(alpha, beta, res)
+dx = 360./(res - 1) # beam grid spacing in degrees (linspace includes the endpoint)
+ZxIdx = np.clip(np.rint((xlos + 180.)/dx).astype(np.intp), 0, res-1) # x index
+ZyIdx = np.clip(np.rint((ylos + 180.)/dx).astype(np.intp), 0, res-1) # y index
 
 doDm = True
 snrfig, snrax = plt.subplots() # will use to plot snr vs dm curve
@@ -166,7 +166,7 @@ while doDm:
 #========================================
     for i in np.arange(len(freq)):
         heights = bm.height_f(H, freq[i]) # frequency dependent H
-        pr, Z = generateBeam(P, alpha, beta, freq[i], heights, npatch, snr, do_ab, iseed, fanBeam)
+        pr, Z = generateBeam(P, alpha, beta, ZxIdx, ZyIdx, freq[i], heights, npatch, snr, do_ab, iseed, fanBeam)
         w10.append(bm.find_width(pr)) # Width at 10% of the peak 
         prof.append(pr)               # Profile for that frequency
         beam.append(Z)                # 2D beam 
@@ -216,9 +216,9 @@ while doDm:
     SN = np.asarray(SN)
     snr_threshold = 10
     highres_phase = np.linspace(-180,180,10*res)
-    resampled = np.zeros((int(nch),int(10*res)))
+    resampled = np.zeros((nch, 10*res))
     for nfr in range(len(freq)):
-        resampled[nfr] = sci_sig.resample(profile[nfr], int(10*res))
+        resampled[nfr] = sci_sig.resample(profile[nfr], 10*res)
     if any(i < snr_threshold for i in SN):
         print "Searching for profiles above threshold!"
         iseed = np.random.randint(0, 4294967295)
@@ -228,18 +228,15 @@ while doDm:
         for p_id in profile:
             rms = bm.noise_rms(snr)
             sigtonoise = bm.signal_to_noise(np.max(p_id), rms)
-        average_profile = []
         peaks_of_average = []
         phase_bin0 = bm.find_phase_bin(resampled[nch - 1])
         phase_bin1 = bm.find_phase_bin(resampled[0])
         dm_range = bm.find_delta_dm(P, resampled, highres_phase, phase_bin0, phase_bin1, freq[nch - 1], freq[0], nch)
+        # Shift (in bins) of every channel for every dm trial; res increased by 10 more bins
+        bin_shifts = bm.delay(freq[nch - 1], freq[:nch - 1], dm_range[:, None], t_res/10.)
         for dm_id in range(len(dm_range)):
-            shifted_profile = []
-            for freq_id in range(nch-1):
-                bin_shift = bm.delay(freq[nch - 1], freq[freq_id], dm_range[dm_id], t_res/10.)
-                shifted_profile.append(np.roll(resampled[freq_id], bin_shift))
-            average_profile.append(bm.avg_prof(shifted_profile))
-            peaks_of_average.append(bm.find_peak(average_profile[dm_id]))
+            average = bm.avg_shifted_prof(resampled[:nch - 1], bin_shifts[dm_id])
+            peaks_of_average.append(bm.find_peak(average))
         # Create a snr vs dm plot for visualization
         snrax.plot(dm_range, peaks_of_average)
         snrax.set_title('Best dm trial')
@@ -248,14 +245,12 @@ while doDm:
         snrfig.savefig('SNR_DM.png')
 
         # Find the best dm (dm that maximises SNR)
-        for i in range(len(peaks_of_average)):
-            if peaks_of_average[i] == np.max(peaks_of_average):
-                best_dm = dm_range[i]
+        best_dm = dm_range[int(np.argmax(peaks_of_average))]
     
         # Write out important parameters into a file    
         pulsarParams = np.asarray([P, alpha, beta, w10[0], w10[-1], iseed, rand_dm, best_dm])
-        f = open(fileName, 'a')
-        f.write(' '.join([str(item) for item in pulsarParams]) + ' \n')
+        with open(fileName, 'a') as f:
+            f.write(' '.join([str(item) for item in pulsarParams]) + ' \n')
         doDm = False
 #==================================================================
 #                     PRODUCE PLOTS:
@@ -279,20 +274,19 @@ if args.getPlot:
     #============================================
     #    2D emission region:
     #============================================
-    xlos, ylos, thetalos = bm.los(alpha, beta, res)
     fig3 = plt.figure(figsize=(10,5))
     ax3 = fig3.add_subplot(1,2,1)
     plt.plot(xlos, ylos, '+r')
-    plt.imshow(beam[0].T, extent=[-180, 180, 180, -180])
+    plt.imshow(beam[0], extent=[-180, 180, 180, -180])
     plt.xlabel('X (degrees)')
     plt.title('Beam')
     plt.ylabel('Y (degrees)')
     # find zoomed extent for plot
-    nonZero = np.where(beam[0]!= 0.0)
-    nzx_min = np.min(np.amin(nonZero,0))
-    nzy_min = np.min(np.amin(nonZero,1))
-    nzx_max = np.max(np.amax(nonZero,0))
-    nzy_max = np.max(np.amax(nonZero,1))
+    nonZero = beam[0] != 0.0
+    rows = np.flatnonzero(nonZero.any(axis=1)) # rows are y
+    cols = np.flatnonzero(nonZero.any(axis=0)) # columns are x
+    nzy_min, nzy_max = rows[0], rows[-1]
+    nzx_min, nzx_max = cols[0], cols[-1]
     x1 = phase[nzx_min]
     x2 = phase[nzx_max]
     y1 = phase[nzy_min]
@@ -313,7 +307,7 @@ if args.getPlot:
         fig3 = plt.figure(figsize=(10,5))
         ax3 = fig3.add_subplot(1,2,1)
         plt.plot(xlos, ylos, '+r')
-        plt.imshow(beam[bid].T, extent=[-180, 180, 180, -180])
+        plt.imshow(beam[bid], extent=[-180, 180, 180, -180])
         plt.xlabel('X (degrees)')
         plt.title('Radio pulsar beam')
         plt.ylabel('Y (degrees)')
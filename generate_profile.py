@@ -559,7 +559,7 @@ def add_noise(prof, rms, iseed, res):
     """
     peak = find_peak(prof)
     noise = np.random.normal(0, rms, res)
-    noisy_prof = np.asarray(prof).T
+    noisy_prof = np.array(prof, dtype=float).T # a copy, so prof itself stays noiseless
     for i in range(np.shape(prof)[0]):
         noisy_prof[:,i] += noise
     '''
@@ -572,7 +572,7 @@ def add_noise(prof, rms, iseed, res):
 #====================================================================================================================================================
 # 							BEAM PLOT:
 #====================================================================================================================================================
-def generateBeam(P, alpha, beta, freq, dm, heights, npatch, snr, do_ab):
+def generateBeam(P, alpha, beta, ZxIdx, ZyIdx, freq, dm, heights, npatch, snr, do_ab):
     """Function to plot the patches for a given rotation period.
     
        A rgs:
@@ -580,6 +580,8 @@ def generateBeam(P, alpha, beta, freq, dm, heights, npatch, snr, do_ab):
        P       : rotational period (seconds)
        alpha   : inclination angle (degrees)
        beta    : impact parameter (degrees)
+       ZxIdx   : x indices of the beam pixels along the line of sight
+       ZyIdx   : y indices of the beam pixels along the line of sight
        heights : emission heights (in km)
        centerx : the patch center projection on the x-axis 
        centery : the patch center projection on the y-axis
@@ -594,11 +596,9 @@ def generateBeam(P, alpha, beta, freq, dm, heights, npatch, snr, do_ab):
 #   initialize parameters:
     xmin = -180.
     xmax = 180.
-    res = 1e3 #resolution
+    res = 1000 #resolution
     ymin = -180.
     ymax = 180.
-    dx = (xmax - xmin)/res
-    dy = (ymax - ymin)/res
     x = np.linspace(xmin, xmax, num=res, endpoint=True)
     y = np.linspace(ymin, ymax, num=res, endpoint=True)
     X,Y = np.meshgrid(x,y)
@@ -610,8 +610,6 @@ def generateBeam(P, alpha, beta, freq, dm, heights, npatch, snr, do_ab):
     patchwidths = patch_width(P, heights)
 #   An arbitrary peak of the profile:
     peakAmp = 1.   
-#   Get the line of sight:
-    xlos, ylos, thetalos = los(alpha, beta, res)
 #   Get the centre of the emission patches on the xy-plane
     centerx, centery = patch_center(P, heights, npatch)
 #   Get the ofset due to abberation:
@@ -643,9 +641,7 @@ def generateBeam(P, alpha, beta, freq, dm, heights, npatch, snr, do_ab):
                 Z += distance * np.exp(-((X - pc[0] - ab_xofset[cid])**2 / (2 * sigmax**2) + (Y - pc[1] - ab_yofset[cid])**2 / (2 * sigmay**2)))
             
 #   1D profile from 2D patch, closest to the line of sight (select nearest neighbors):
-    ZxIdx = np.array((xlos-xmin)/dx, dtype=int) # x index
-    ZyIdx = np.array((ylos-ymin)/dy, dtype=int) # y index
-    prof = Z[ZxIdx, ZyIdx]
+    prof = Z[ZyIdx, ZxIdx] # rows of Z are y, columns are x
 
     return prof, Z 
 
@@ -700,15 +696,20 @@ paramsFile = fileName+'_parameters'
 #=====================
 # initialize params:
 #=====================
-beam = []
-prof = []
-peaks = []
-w10 = []
-res = 1e3
+res = 1000
 t_res = P/res
 phase = np.linspace(-180, 180, num=res)
 max_freq = (nch - 1) * chbw + min_freq
 freq = np.linspace(min_freq, max_freq, nch) #channel frequency in GHz!!!
+beam = np.empty((nch, res, res))
+prof = np.empty((nch, res))
+peaks = np.empty(nch)
+w10 = np.empty(nch)
+# The line of sight, and the beam pixels nearest to it, are the same at every frequency:
+xlos, ylos, thetalos = los(alpha, beta, res)
+dx = 360./(res - 1) # beam grid spacing in degrees (linspace includes the endpoint)
+ZxIdx = np.clip(np.rint((xlos + 180.)/dx).astype(np.intp), 0, res-1) # x index
+ZyIdx = np.clip(np.rint((ylos + 180.)/dx).astype(np.intp), 0, res-1) # y index
 
 #=======================================
 #     1. Find the emission height:
@@ -719,10 +720,10 @@ H = emission_height(P, ncomp, iseed, hmin, hmax)
 #========================================
 for i in np.arange(len(freq)):
     heights = height_f(H, freq[i]) # frequency dependent H
-    pr, Z = generateBeam(P, alpha, beta, freq[i], dm, heights, npatch, snr, do_ab)
-    w10.append(find_width(pr))
-    prof.append(pr)
-    beam.append(Z)
+    pr, Z = generateBeam(P, alpha, beta, ZxIdx, ZyIdx, freq[i], dm, heights, npatch, snr, do_ab)
+    w10[i] = find_width(pr)
+    prof[i] = pr
+    beam[i] = Z
 
 
 #==========================================
@@ -730,7 +731,6 @@ for i in np.arange(len(freq)):
 #==========================================
 train = []
 bf = []
-tau = sc_time(freq, dm, iseed)
 if scr == None:
     sc_prof = prof # returns the profile without scattering and store that in sc_prof
 
@@ -739,9 +739,9 @@ else:
     for pid in np.arange(len(prof)):
         train.append(pulsetrain(3, res, prof[pid]))
 
+    tau_all = sc_time(freq, dm, iseed) # scattering time at every frequency
     for fid in np.arange(len(freq)):
-        tau = sc_time(freq[fid], dm, iseed)
-        bf = broadening(tau, P, res)
+        bf = broadening(tau_all[fid], P, res)
         sc_train = scatter(train[fid], bf)
         sc_prof.append(extractpulse(sc_train, 2, res)) #scattered pulse profile
 
@@ -749,7 +749,7 @@ else:
 #     5. Add noise
 #===========================================
 for j in np.arange(len(prof)):
-    peaks.append(find_peak(sc_prof[j]))
+    peaks[j] = find_peak(sc_prof[j])
  
 if snr == None:
     profile = sc_prof
@@ -794,7 +794,6 @@ plt.grid()
 
 #    2D emission region:
 meanBeam = np.mean(beam, axis=0)
-xlos, ylos, thetalos = los(alpha, beta, res)
 #for i in range(len(beam)):
 '''
 =======
@@ -802,7 +801,7 @@ xlos, ylos, thetalos = los(alpha, beta, res)
 plt.figure(figsize=(10,5))
 plt.subplot(1, 2, 1)
 plt.plot(xlos, ylos, '+r')
-plt.imshow(beam[0].T, extent=[-180, 180, 180, -180])
+plt.imshow(beam[0], extent=[-180, 180, 180, -180])
 plt.xlabel('X (degrees)')
 plt.ylabel('Y (degrees)')
 # find zoomed extent for plot
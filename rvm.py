@@ -15,7 +15,7 @@ def rvm(alpha,beta,phi0,psi0,xprof):
         beta    : the impact parameter in degrees.
         phi0    : the rotational phase at the fiducial point in degrees.
         psi0    : the position angle at the fiducial point in degrees.
-        xprof   : .  
+        xprof   : the rotational phases in degrees.
         
     Returns:
     --------
@@ -25,32 +25,20 @@ def rvm(alpha,beta,phi0,psi0,xprof):
     """
 
     # Converting the input angles to radians:
-    angles = alpha, beta, phi0, psi0
-    angRad = np.deg2rad(angles)
+    alpha, beta, phi0, psi0 = np.deg2rad([alpha, beta, phi0, psi0])
+    phi = np.deg2rad(xprof)
             
     # Predict the position angle (psi) swing through the observer's sight line:
     zeta = alpha + beta
-    npts = len(xprof)
-    points = range(1,npts + 1)
-    
-    pa = []
+    numer = np.sin(alpha) * np.sin(phi - phi0)
+    denom = np.sin(zeta) * np.cos(alpha) - np.cos(zeta) * np.sin(alpha) * np.cos(phi - phi0)
+    psi = psi0 + np.arctan2(numer, denom)
 
-    for point in points:
-        phi = np.deg2rad(xprof[point - 1])
-        numer = np.sin(alpha) * np.sin(phi - phi0)
-        denom = np.sin(zeta) * np.cos(alpha) - np.cos(zeta) * np.sin(alpha) * np.cos(phi - phi0)
-        
-        psi = psi0 + np.arctan(numer/denom)
-        
-        # restrict psi between [-pi/2, pi/2]
-        if psi < -np.pi/2.:
-            psi = psi + np.pi
-            
-        if psi > np.pi/2.:
-              psi = psi - np.pi
-            
-        # Convert psi back to degrees
-        pa.append(np.rad2deg(psi))
+    # restrict psi between [-pi/2, pi/2]
+    psi = (psi + np.pi/2.) % np.pi - np.pi/2.
+
+    # Convert psi back to degrees
+    pa = np.rad2deg(psi)
         
     return pa
 